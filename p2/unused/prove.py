@@ -32,9 +32,18 @@ THE SOFTWARE.
 # TODO When ONE_DIRECTORY_VALUE is False, check if is_assertion is really checking
 # whether the command changes types. C.f. the definitions in the paper.
 
-from itertools import chain
 import sys
 
+import numpy as np
+
+# Numba is optional. If it is available, the innermost table gathers are
+# compiled; the two lookups of a command pair are fused into a single loop
+# with no intermediate array.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 # Whether directories have equal contents, i.e. there is only a single
 # directory-type value (object).
 ONE_DIRECTORY_VALUE = True
@@ -42,22 +51,24 @@ ONE_DIRECTORY_VALUE = True
 DEBUG = False
 
 # Types
-EMPTY = 'Empty'
-FILE = 'File'
-DIR = 'Dir'
+(EMPTY, FILE, DIR) = (0, 1, 2)
 
 # Relationships
-SAME = 'Same'
-DIRECT = 'Direct'
-DISTANT = 'Distant'
-SEPARATE = 'Separate'
+(SAME, DIRECT, DISTANT, SEPARATE) = (0, 1, 2, 3)
 
 # Paths
-PATH1 = 'Path1' # If they are comparable, this is the ancestor
-PATH2 = 'Path2' # If they are comparable, this is the descendant
+PATH1 = 0 # If they are comparable, this is the ancestor
+PATH2 = 1 # If they are comparable, this is the descendant
+
+# Names of the constants above, for info() output only
+TYPE_NAMES = {EMPTY: 'Empty', FILE: 'File', DIR: 'Dir'}
+REL_NAMES = {SAME: 'Same', DIRECT: 'Direct', DISTANT: 'Distant', SEPARATE: 'Separate'}
+PATH_NAMES = {PATH1: 'Path1', PATH2: 'Path2'}
 
 class Node:
-    
+
+    __slots__ = ('type', 'value', '_has_children', '_is_parent_dir')
+
     def __init__(self, type=EMPTY, value='Unknown', has_children=False, is_parent_dir=False):
         self.type = type
         self.value = value
@@ -67,9 +78,6 @@ class Node:
         self._has_children = has_children
         self._is_parent_dir = is_parent_dir
 
-    def clone(self):
-        return self.__class__(self.type, self.value, self._has_children, self._is_parent_dir)
-
     def is_content_same(self, other):
         if self.type != other.type: return False
         if self.type == EMPTY: return True
@@ -77,98 +85,112 @@ class Node:
         return (self.value == other.value)
 
 
+_NODE_POOL = {}
+
+def get_node(type, value, has_children, is_parent_dir):
+    """ Returns the pooled Node with the given state. Nodes are never
+        modified once created, so the instances can be shared freely """
+    key = (type, value, has_children, is_parent_dir)
+    node = _NODE_POOL.get(key)
+    if node is None:
+        node = Node(type, value, has_children, is_parent_dir)
+        _NODE_POOL[key] = node
+    return node
+
+
 def NodeFactory(value='Unknown'):
     for type in (EMPTY, FILE, DIR):
         for has_children in (False, True):
             for is_parent_dir in (False, True):
-                yield Node(type, value, has_children, is_parent_dir)
+                yield get_node(type, value, has_children, is_parent_dir)
+
+
+# Precomputed tree-property check for a single node, keyed by
+# (type, has_children, is_parent_dir). Non-empty nodes must have directories
+# as parents, and nodes with children must be directories.
+_TREE_OK = {
+    (type, has_children, is_parent_dir):
+        (type == EMPTY or bool(is_parent_dir)) and (has_children == 0 or type == DIR)
+    for type in (EMPTY, FILE, DIR)
+    for has_children in (0, 1, 2)
+    for is_parent_dir in (0, 1)
+}
 
 
 class Filesystem:
 
+    __slots__ = ('node1', 'node2', 'relationship', 'broken')
+
     def __init__(self, node1, node2, relationship, broken=False):
         self.node1 = node1 # If they are comparable, this is the ancestor
         self.node2 = node2 # If they are comparable, this is the descendant
         self.relationship = relationship
         self.broken = broken
 
-    def clone(self):
-        return self.__class__(self.node1.clone(), self.node2.clone(), self.relationship, self.broken)
-        
     def node_info(self, path):
         (node, npath) = self.get_node_path(path)
         c = self.has_children(npath)
-        return ("d-" if self.is_parent_dir(npath) else "") + node.type + "(" + node.value + ")" + ("-o" if c == 1 else ("-oo" if c == 2 else ""))
+        return ("d-" if self.is_parent_dir(npath) else "") + f"{TYPE_NAMES[node.type]}({node.value})" + ("-o" if c == 1 else ("-oo" if c == 2 else ""))
 
     def info(self):
         if self.broken:
-            return 'Broken';
+            return 'Broken'
         if self.relationship == SAME:
-            return self.node_info(PATH1) + " <SAME>"
-        return self.node_info(PATH1) + " >" + self.relationship + "> " + self.node_info(PATH2)
+            return f"{self.node_info(PATH1)} <SAME>"
+        return f"{self.node_info(PATH1)} >{REL_NAMES[self.relationship]}> {self.node_info(PATH2)}"
 
     def get_node_path(self, path):
         if self.relationship == SAME or path == PATH1: return (self.node1, PATH1)
         return (self.node2, PATH2)
     
+    # Implementations of has_children by (relationship, path), dispatched on
+    # a dict lookup instead of an if-ladder over the relationships.
+    # For the parent (DIRECT) or the ancestor (DISTANT), the _has_children
+    # flag is used in addition to the child (node2) to note if the parent
+    # has more non-empty children.
+    _HAS_CHILDREN = {
+        (SAME, PATH1): lambda self: self.node1._has_children + 0,
+        (SAME, PATH2): lambda self: self.node1._has_children + 0,
+        (SEPARATE, PATH1): lambda self: self.node1._has_children + 0,
+        (SEPARATE, PATH2): lambda self: self.node2._has_children + 0,
+        (DIRECT, PATH1): lambda self: (self.node2.type != EMPTY) + self.node1._has_children,
+        (DIRECT, PATH2): lambda self: self.node2._has_children + 0,
+        (DISTANT, PATH1): lambda self: (self.node2.type != EMPTY) + self.node1._has_children,
+        (DISTANT, PATH2): lambda self: self.node2._has_children + 0,
+    }
+
     def has_children(self, path):
         """ Returns if the node at the path has no non-empty children (0) or as some non-empty childrent (1 or 2).
             Returns 2 if the ancestor node (path1) has non-empty children in addition to the one related to the descendant
             (path2)."""
-        if self.relationship == SAME:
-            return self.node1._has_children + 0
-        
-        if self.relationship == SEPARATE:
-            if path == PATH1:
-                return self.node1._has_children + 0
-            else:
-                return self.node2._has_children + 0
-
-        if self.relationship == DIRECT:
-            if path == PATH1: # the parent
-                # The parent's _has_children flag is used in addition to the child (node2)
-                # to note if the parent has more non-empty children
-                return ((self.node2.type != EMPTY) + self.node1._has_children)
-            else: # the child
-                return self.node2._has_children + 0
-            
-        if self.relationship == DISTANT:
-            if path == PATH1: # the ancestor
-                # The ancestor's _has_children flag is used in addition to its child that is the ancestor of node2
-                # to note if the parent has more non-empty children
-                return ((self.node2.type != EMPTY) + self.node1._has_children)
-            else: # the descendant
-                return self.node2._has_children + 0
+        return self._HAS_CHILDREN[(self.relationship, path)](self)
+
+    # Implementations of is_parent_dir by (relationship, path).
+    # For the descendant (DISTANT), the _is_parent_dir flag is used to note
+    # whether the descendant (path2) has a directory at its parent, which may
+    # still be false even if there is a directory at the ancestor (path1).
+    # However, if the ancestor does not have a directory, _is_parent_dir
+    # should not be set at all as otherwise changing the ancestor to a
+    # directory would suddenly make the descendant have a directory parent,
+    # too. To note this, we return False.
+    _IS_PARENT_DIR = {
+        (SAME, PATH1): lambda self: self.node1._is_parent_dir + 0,
+        (SAME, PATH2): lambda self: self.node1._is_parent_dir + 0,
+        (SEPARATE, PATH1): lambda self: self.node1._is_parent_dir + 0,
+        (SEPARATE, PATH2): lambda self: self.node2._is_parent_dir + 0,
+        (DIRECT, PATH1): lambda self: self.node1._is_parent_dir,
+        (DIRECT, PATH2): lambda self: (self.node1.type == DIR) + 0,
+        (DISTANT, PATH1): lambda self: self.node1._is_parent_dir + 0,
+        (DISTANT, PATH2): lambda self: (
+            False if (self.node1.type != DIR and self.node2._is_parent_dir)
+            else (self.node1.type == DIR and self.node2._is_parent_dir) + 0
+        ),
+    }
 
     def is_parent_dir(self, path):
         """ Returns whether there is a directory at the parent of the node at path (1) or not (0).
             Returns False if the underlying _is_parent_dir flag has a non-permitted value. """
-        if self.relationship == SAME:
-            return self.node1._is_parent_dir + 0
-        
-        if self.relationship == SEPARATE:
-            if path == PATH1:
-                return self.node1._is_parent_dir + 0
-            else:
-                return self.node2._is_parent_dir + 0
-            
-        if self.relationship == DIRECT:
-            if path == PATH1: # the parent
-                return self.node1._is_parent_dir
-            else: # the child
-                return (self.node1.type == DIR) + 0
-            
-        if self.relationship == DISTANT:
-            if path == PATH1: # the ancestor
-                return self.node1._is_parent_dir + 0
-            else: # the descendant
-                # The _is_parent_dir flag is used to note whether the descendant (path2) has a directory
-                # at its parent, which may still be false even if there is a directory at the ancestor (path1).
-                # However, if the ancestor does not have a directory, _is_parent_dir should not be set at all
-                # as otherwise changing the ancestor to a directory would suddenly make the descendant have
-                # a directory parent, too. To note this, we return False.
-                if self.node1.type != DIR and self.node2._is_parent_dir: return False
-                return (self.node1.type == DIR and self.node2._is_parent_dir) + 0
+        return self._IS_PARENT_DIR[(self.relationship, path)](self)
 
     def is_same(self, other):
         if self.broken and other.broken:
@@ -196,28 +218,29 @@ class Filesystem:
         """ Returns True or False """
         for path in (PATH1, PATH2):
             (node, npath) = self.get_node_path(path)
-            # Non-empty nodes must have directories as parents
-            if node.type != EMPTY:
-                if not self.is_parent_dir(npath): return False
-            # Nodes with childrent must be directories
-            if self.has_children(npath):
-                if node.type != DIR: return False
-            # Cannot have a potential directory parent (see above).
+            is_parent_dir = self.is_parent_dir(npath)
+            # Cannot have a potential directory parent (see is_parent_dir).
             # This way we filter these filesystems out in FilesystemFactory.
-            if self.is_parent_dir(npath) is False: return False
+            # Note that this must be checked before the dict lookup as the
+            # bool False hashes like the int 0.
+            if is_parent_dir is False: return False
+            if not _TREE_OK[(node.type, self.has_children(npath), is_parent_dir)]: return False
         return True
 
     def apply_command(self, command):
-        """ Clones the filesystem and applies command to it. Returns the new filesystem. """
-        fs = self.clone()
-        (node, npath) = fs.get_node_path(command.path)
-        if DEBUG: print("Apply command " + command.info() + " to " + npath + "\n  Filesystem: " + fs.info())
+        """ Applies command to the filesystem and returns the resulting filesystem.
+            The filesystem itself is never modified; the result shares the
+            unaffected node with it. """
+        (node, npath) = self.get_node_path(command.path)
+        if DEBUG: print(f"Apply command {command.info()} to {PATH_NAMES[npath]}\n  Filesystem: {self.info()}")
         if node.type != command.intype:
-            fs.broken = True
             if DEBUG: print("  FS broken due to intype mismatch")
-            return fs
-        node.type = command.outtype
-        node.value = command.outvalue
+            return Filesystem(self.node1, self.node2, self.relationship, broken=True)
+        new_node = get_node(command.outtype, command.outvalue, node._has_children, node._is_parent_dir)
+        if npath == PATH1:
+            fs = Filesystem(new_node, self.node2, self.relationship, self.broken)
+        else:
+            fs = Filesystem(self.node1, new_node, self.relationship, self.broken)
         if not fs.has_tree_property():
             fs.broken = True
             if DEBUG: print("  FS broken due to tree property violation")
@@ -239,15 +262,22 @@ def FilesystemFactory(relationship):
 
 
 class Command:
-    
+
+    __slots__ = ('intype', 'outtype', 'outvalue', 'path', 'cmd_id', '_info')
+
     def __init__(self, intype, outtype, outvalue, path):
         self.intype = intype
         self.outtype = outtype
         self.outvalue = outvalue
         self.path = path
+        self.cmd_id = None # Assigned by command_id()
+        self._info = None
 
     def info(self):
-        return "<" + ",".join((self.intype,self.outtype,self.outvalue,self.path)) + ">"
+        # Commands are immutable and long-lived, so the string is built once
+        if self._info is None:
+            self._info = f"<{TYPE_NAMES[self.intype]},{TYPE_NAMES[self.outtype]},{self.outvalue},{PATH_NAMES[self.path]}>"
+        return self._info
 
     def is_empty_empty(self):
         return (self.intype == EMPTY and self.outtype == EMPTY)
@@ -262,13 +292,23 @@ class Command:
 
 
 def CommandFactory(path, outvalue):
+    # Commands that do not change the type come first. These are the least
+    # likely to break a filesystem, so rules that search for a witness
+    # (rather than for a counterexample) can stop sooner. The rules check
+    # an exhaustive or existential condition, so the order does not affect
+    # their outcome.
+    for intype in (EMPTY, FILE, DIR):
+        yield Command(intype, intype, outvalue, path)
     for intype in (EMPTY, FILE, DIR):
         for outtype in (EMPTY, FILE, DIR):
-            yield Command(intype, outtype, outvalue, path)
+            if outtype != intype:
+                yield Command(intype, outtype, outvalue, path)
 
 
 class CommandPair:
-    
+
+    __slots__ = ('first', 'last')
+
     def __init__(self, first, last):
         self.first = first
         self.last = last
@@ -344,10 +384,237 @@ def CommandPairFactory():
                 yield CommandPair(firstcommand, secondcommand)
 
 
+# Integer encoding of filesystems and commands
+#
+# The classes above define the semantics of the model. As the state space is
+# tiny, we enumerate it once and encode each filesystem as a small integer,
+# and precompute the effect of every command on every filesystem in a lookup
+# table. The exhaustive checks below then reduce to table lookups instead of
+# cloning objects and re-deriving the tree property for every application.
+
+RELATIONSHIPS = (SAME, DIRECT, DISTANT, SEPARATE)
+NODE_VALUES = ('Old1', 'Old2', 'New1', 'New2')
+
+# All raw node states as (type, value, _has_children, _is_parent_dir)
+NODE_STATES = tuple(
+    (type, value, has_children, is_parent_dir)
+    for type in (EMPTY, FILE, DIR)
+    for value in NODE_VALUES
+    for has_children in (False, True)
+    for is_parent_dir in (False, True)
+)
+NODE_STATE_ID = {state: i for (i, state) in enumerate(NODE_STATES)}
+NUM_NODES = len(NODE_STATES)
+
+# The relationship constants are small ints, so they serve as their own ids
+NUM_RELS = len(RELATIONSHIPS)
+
+# A filesystem id bit-packs the two node ids and the relationship, so
+# encoding and decoding are shifts and masks, and the whole id fits a uint16
+NODE_BITS = 6
+REL_BITS = 2
+assert NUM_NODES <= (1 << NODE_BITS) and NUM_RELS <= (1 << REL_BITS)
+NODE_MASK = (1 << NODE_BITS) - 1
+REL_MASK = (1 << REL_BITS) - 1
+
+BROKEN_FS = 1 << (2 * NODE_BITS + REL_BITS) # A single id represents all broken filesystems
+
+
+def node_state_id(node):
+    return NODE_STATE_ID[(node.type, node.value, node._has_children, node._is_parent_dir)]
+
+
+def encode_fs(fs):
+    """ Returns the integer id of a filesystem object """
+    if fs.broken: return BROKEN_FS
+    return (node_state_id(fs.node1) << (NODE_BITS + REL_BITS)) | (node_state_id(fs.node2) << REL_BITS) | fs.relationship
+
+
+def decode_fs(fs_id):
+    """ Returns the filesystem object encoded by fs_id """
+    if fs_id == BROKEN_FS:
+        return Filesystem(Node(), Node(), SAME, broken=True)
+    return Filesystem(
+        get_node(*NODE_STATES[fs_id >> (NODE_BITS + REL_BITS)]),
+        get_node(*NODE_STATES[(fs_id >> REL_BITS) & NODE_MASK]),
+        fs_id & REL_MASK,
+    )
+
+
+# The bit-packing leaves gaps in the id space; these are the ids that encode
+# actual filesystems
+VALID_FS_IDS = tuple(
+    (node1_id << (NODE_BITS + REL_BITS)) | (node2_id << REL_BITS) | rel
+    for node1_id in range(NUM_NODES)
+    for node2_id in range(NUM_NODES)
+    for rel in RELATIONSHIPS
+)
+
+
+def command_key(command):
+    """ Returns a key identifying the command up to output values that cannot
+        be observed: the value written into an empty node is never read, and
+        neither is the value of a directory if ONE_DIRECTORY_VALUE """
+    if command.outtype == EMPTY or (command.outtype == DIR and ONE_DIRECTORY_VALUE):
+        outvalue = None
+    else:
+        outvalue = command.outvalue
+    return (command.intype, command.outtype, outvalue, command.path)
+
+
+# All commands the factories can construct (they only ever write 'New1' or
+# 'New2'), deduplicated by command_key
+_commands = {}
+for _path in (PATH1, PATH2):
+    for _outvalue in ('New1', 'New2'):
+        for _command in CommandFactory(_path, _outvalue):
+            _commands.setdefault(command_key(_command), _command)
+ALL_COMMANDS = tuple(_commands.values())
+CMD_ID = {key: i for (i, key) in enumerate(_commands)}
+NUM_CMDS = len(ALL_COMMANDS)
+
+
+def command_id(command):
+    """ Returns the id of the command, cached on the instance """
+    if command.cmd_id is None:
+        command.cmd_id = CMD_ID[command_key(command)]
+    return command.cmd_id
+
+
+# The transition table: NEXT[fs_id, cmd_id] is the filesystem resulting from
+# applying the command to the filesystem
+NEXT = np.full((BROKEN_FS + 1, NUM_CMDS), BROKEN_FS, dtype=np.uint16)
+for fs_id in VALID_FS_IDS:
+    fs = decode_fs(fs_id)
+    for (cmd_id, command) in enumerate(ALL_COMMANDS):
+        NEXT[fs_id, cmd_id] = encode_fs(fs.apply_command(command))
+
+
+def canonical_key(fs):
+    """ Returns a hashable key so that two non-broken filesystems are is_same
+        exactly if their keys are equal """
+    key = [fs.relationship]
+    for path in (PATH1, PATH2):
+        (node, npath) = fs.get_node_path(path)
+        if node.type == EMPTY or (node.type == DIR and ONE_DIRECTORY_VALUE):
+            content = node.type
+        else:
+            content = (node.type, node.value)
+        key.append((content, fs.has_children(npath), fs.is_parent_dir(npath)))
+    return tuple(key)
+
+
+# CANON[fs_id] identifies the equivalence class of the filesystem under
+# is_same: two filesystems are is_same exactly if their classes are equal
+CANON = np.zeros(BROKEN_FS + 1, dtype=np.uint16)
+_canonical_ids = {}
+for fs_id in VALID_FS_IDS:
+    key = canonical_key(decode_fs(fs_id))
+    CANON[fs_id] = _canonical_ids.setdefault(key, len(_canonical_ids))
+CANON[BROKEN_FS] = len(_canonical_ids)
+
+def unique_fs_ids(fs_ids):
+    """ Keeps one filesystem per is_same equivalence class. Equivalent
+        filesystems only differ in node flags that no method reads under
+        their relationship, so commands affect them identically and the
+        rules need to check one representative only """
+    (_, first_indices) = np.unique(CANON[fs_ids], return_index=True)
+    return fs_ids[np.sort(first_indices)]
+
+
+# The filesystems from FilesystemFactory for each relationship, as ids,
+# deduplicated up to is_same
+FS_IDS_BY_REL = {
+    rel: unique_fs_ids(np.fromiter((encode_fs(fs) for fs in FilesystemFactory(rel)), dtype=np.uint16))
+    for rel in RELATIONSHIPS
+}
+
+# The filesystems whose nodes are comparable but different, for the rules
+# that check both relationships together
+FS_IDS_COMPARABLE = np.concatenate((FS_IDS_BY_REL[DIRECT], FS_IDS_BY_REL[DISTANT]))
+
+# All filesystem id arrays the rules sweep over, by key
+COMPARABLE = 'Comparable' # key of the combined DIRECT+DISTANT array
+FS_IDS = dict(FS_IDS_BY_REL)
+FS_IDS[COMPARABLE] = FS_IDS_COMPARABLE
+
+# Several rules apply the same command or command pair to the same filesystem
+# array (e.g. Rule 2 re-checks the sequences of Rule 1, and the sequence
+# results share their first-command gather), so the result arrays are cached
+_CMD_RESULTS = {}
+_SEQ_RESULTS = {}
+
+
+def cmd_results(fs_key, c):
+    """ Returns the results of applying the command to the filesystems in
+        FS_IDS[fs_key], cached """
+    key = (fs_key, c)
+    res = _CMD_RESULTS.get(key)
+    if res is None:
+        res = NEXT[FS_IDS[fs_key], c]
+        _CMD_RESULTS[key] = res
+    return res
+
+
+_CMD_KILLS_ALL = {}
+
+def cmd_kills_all(fs_key, c):
+    """ Returns whether the command breaks every filesystem in
+        FS_IDS[fs_key], cached """
+    key = (fs_key, c)
+    flag = _CMD_KILLS_ALL.get(key)
+    if flag is None:
+        flag = bool((cmd_results(fs_key, c) == BROKEN_FS).all())
+        _CMD_KILLS_ALL[key] = flag
+    return flag
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _seq_gather(next_table, fs_ids, c1, c2):
+        res = np.empty(fs_ids.shape[0], dtype=next_table.dtype)
+        for i in range(fs_ids.shape[0]):
+            res[i] = next_table[next_table[fs_ids[i], c1], c2]
+        return res
+
+
+def seq_results(fs_key, c1, c2):
+    """ Returns the results of applying the command pair to the filesystems
+        in FS_IDS[fs_key], cached """
+    key = (fs_key, c1, c2)
+    res = _SEQ_RESULTS.get(key)
+    if res is None:
+        if cmd_kills_all(fs_key, c1):
+            # No filesystem survives the first command, so no second command
+            # can match anything: the pair result is the all-broken array
+            res = cmd_results(fs_key, c1)
+        elif njit is None:
+            res = NEXT[cmd_results(fs_key, c1), c2]
+        else:
+            res = _seq_gather(NEXT, FS_IDS[fs_key], c1, c2)
+        _SEQ_RESULTS[key] = res
+    return res
+
+# All command pairs, deduplicated: pairs whose commands map to the same ids
+# would yield identical results on every filesystem
+_pairs = {}
+for _sq in CommandPairFactory():
+    _pairs.setdefault((command_id(_sq.first), command_id(_sq.last)), _sq)
+COMMAND_PAIRS = tuple(_pairs.values())
+
+
+_output = []
+
 def pr(s):
-    """Print to STDOUT (without newline) and flush"""
-    sys.stdout.write(s)
-    sys.stdout.flush()
+    """Collect output (without newline); it is written to STDOUT in a single
+       batch by conclude(). When debugging, write immediately instead so the
+       output interleaves with the debug prints."""
+    if DEBUG:
+        sys.stdout.write(s)
+        sys.stdout.flush()
+    else:
+        _output.append(s)
 
 
 count_tests = 0
@@ -360,17 +627,17 @@ def begintest(testname, label):
     """Print the rule name being tested"""
     global count_tests, testname_current, count_errors
     count_tests += 1
-    if not testname_current is None:
-        pr("ERROR: {} did not conclude\n".format(testname_current))
+    if testname_current is not None:
+        pr(f"ERROR: {testname_current} did not conclude\n")
         count_errors += 1
     testname_current = testname
-    pr(label + ": ")
+    pr(f"{label}: ")
 
 def fail(testname):
     global count_fail, testname_current, count_errors
     count_fail += 1
     if testname_current != testname:
-        pr("ERROR while failing test {} vs {}\n".format(testname, testname_current))
+        pr(f"ERROR while failing test {testname} vs {testname_current}\n")
         count_errors += 1
     testname_current = None    
     pr("FAIL\n")
@@ -380,7 +647,7 @@ def ok(testname):
     global count_ok, testname_current, count_errors
     count_ok += 1
     if testname_current != testname:
-        pr("ERROR while OKing test {} vs {}\n".format(testname, testname_current))
+        pr(f"ERROR while OKing test {testname} vs {testname_current}\n")
         count_errors += 1
     testname_current = None    
     pr("Ok\n")
@@ -394,89 +661,91 @@ def conclude():
     if count_fail > 0:
         pr("ERROR: some tests failed\n")
     pr("Done.\n")
+    sys.stdout.write(''.join(_output))
+    sys.stdout.flush()
 
 
 begintest('R1', 'Rule 1')
 # Commands on incomparable nodes commute
-for sq in CommandPairFactory():
-    sq_rev = sq.get_reverse()
-    for fs in FilesystemFactory(SEPARATE):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        fs_rev_res = fs.apply_commandpair(sq_rev)
-        if not fs_res.is_same(fs_rev_res):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            if DEBUG: print("Reverse: " + sq_rev.info())
-            if DEBUG: print("Result: " + fs_rev_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R1')
-    break
+for sq in COMMAND_PAIRS:
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[SEPARATE]
+    res_ids = seq_results(SEPARATE, c1, c2)
+    rev_res_ids = seq_results(SEPARATE, c2, c1)
+    bad = (CANON[res_ids] != CANON[rev_res_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+            print(f"Reverse: {sq.get_reverse().info()}")
+            print(f"Result: {decode_fs(int(rev_res_ids[i])).info()}")
+        fail('R1')
+        break
 else:
     ok('R1')
 
 
 begintest('R2', 'Rule 2')
 # Commands on incomparble nodes do not break all filesystems
-for sq in CommandPairFactory():
-    for fs in FilesystemFactory(SEPARATE):
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.broken:
-            break # OK
-    else:
-        continue # trick to achieve break(2)
-    ok('R2')
-    break
+for sq in COMMAND_PAIRS:
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    res_ids = seq_results(SEPARATE, c1, c2)
+    if (res_ids != BROKEN_FS).any():
+        ok('R2')
+        break
 else:
     fail('R2')
 
 
 begintest('R3', 'Rule 3')
 # Commands on the same node break every filesystem if their types are incompatible
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if sq.can_get_singlecommand(): continue # skip
 
-    for fs in FilesystemFactory(SAME):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.broken:
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R3')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[SAME]
+    res_ids = seq_results(SAME, c1, c2)
+    bad = (res_ids != BROKEN_FS)
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+        fail('R3')
+        break
 else:
     ok('R3')
 
 
 begintest('R4', 'Rule 4')
 # Commands on the same node simplify into an empty sequence
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.can_get_singlecommand(): continue # skip
 
     singlecommand = sq.get_singlecommand()
     
     if not(singlecommand.is_assertion()): continue # skip
 
-    for fs in FilesystemFactory(SAME):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.is_extended_by(fs):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + command_sq_info(sq))
-            if DEBUG: print("Result: " + fs_res.info())
-            if DEBUG: print("SingleCommand: " + singlecommand.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R4')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[SAME]
+    res_ids = seq_results(SAME, c1, c2)
+    bad = (res_ids != BROKEN_FS) & (CANON[res_ids] != CANON[fs_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+            print(f"SingleCommand: {singlecommand.info()}")
+        fail('R4')
+        break
 else:
     ok('R4')
 
@@ -488,103 +757,110 @@ begintest('R5', 'Rule 5' if ONE_DIRECTORY_VALUE else 'Rule 5 - extension')
 # an assertion command, yet it may not break filesystems the original sequence breaks.
 # This is because this is the only command that does not change the type of a node and is not an assertion command
 # (if |[D]|>1).
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.can_get_singlecommand(): continue # skip
     
     singlecommand = sq.get_singlecommand()
     
     if singlecommand.is_assertion(): continue # skip
 
-    for fs in FilesystemFactory(SAME):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        fs_single = fs.apply_command(singlecommand)
-        if ((ONE_DIRECTORY_VALUE and not fs_res.is_same(fs_single))
-            or (not ONE_DIRECTORY_VALUE and not fs_res.is_extended_by(fs_single))):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            if DEBUG: print("SingleCommand: " + singlecommand.info())
-            if DEBUG: print("Result: " + fs_single.info())
-            break # fail
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    c_single = command_id(singlecommand)
+    fs_ids = FS_IDS_BY_REL[SAME]
+    res_ids = seq_results(SAME, c1, c2)
+    single_ids = cmd_results(SAME, c_single)
+    if ONE_DIRECTORY_VALUE:
+        bad = (CANON[res_ids] != CANON[single_ids])
     else:
-        continue # trick to achieve break(2)
-    fail('R5')
-    break
+        bad = (res_ids != BROKEN_FS) & (CANON[res_ids] != CANON[single_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+            print(f"SingleCommand: {singlecommand.info()}")
+            print(f"Result: {decode_fs(int(single_ids[i])).info()}")
+        fail('R5')
+        break
 else:
     ok('R5')
 
 
 begintest('R6', 'Rule 6')
 # Commands on distant relatives break all filesystems
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if sq.is_assertion_pair(): continue # skip
 
-    for fs in FilesystemFactory(DISTANT):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.broken:
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R6')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[DISTANT]
+    res_ids = seq_results(DISTANT, c1, c2)
+    bad = (res_ids != BROKEN_FS)
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+        fail('R6')
+        break
 else:
     ok('R6')
 
 
 begintest('R7', 'Rule 7')
 # Non-construction pairs break all filesystems
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.is_down(): continue # skip
     if sq.is_assertion_pair(): continue # skip
     if sq.is_construction_pair(): continue # skip
 
-    for fs in FilesystemFactory(DIRECT):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.broken:
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R7')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[DIRECT]
+    res_ids = seq_results(DIRECT, c1, c2)
+    bad = (res_ids != BROKEN_FS)
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+        fail('R7')
+        break
 else:
     ok('R7')
     
 
 begintest('R8', 'Rule 8')
 # Non-destruction pairs break all filesystems
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.is_up(): continue # skip
     if sq.is_assertion_pair(): continue # skip
     if sq.is_destruction_pair(): continue # skip
 
-    for fs in FilesystemFactory(DIRECT):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        if not fs_res.broken:
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R8')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    fs_ids = FS_IDS_BY_REL[DIRECT]
+    res_ids = seq_results(DIRECT, c1, c2)
+    bad = (res_ids != BROKEN_FS)
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+        fail('R8')
+        break
 else:
     ok('R8')
 
 
 begintest('R9', 'Rule 9')
 # Add assertion command on a descendant node
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.is_up(): continue # skip
     (command_on_ancestor, command_on_descendant) = sq.get_commands_on_ancestor_descendant()
     if command_on_ancestor.is_dir_dir(): continue # skip
@@ -592,31 +868,35 @@ for sq in CommandPairFactory():
 
     sq_rev = sq.get_reverse()
 
-    for fs in chain(FilesystemFactory(DIRECT), FilesystemFactory(DISTANT)):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        fs_rev_res = fs.apply_commandpair(sq_rev)
-        fs_single = fs.apply_command(command_on_ancestor)
-        if not fs_res.is_same(fs_rev_res) and fs_res.is_same(fs_single):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            if DEBUG: print("Reverse: " + sq_rev.info())
-            if DEBUG: print("Result: " + fs_rev_res.info())
-            if DEBUG: print("SingleCommand: " + singlecommand.info())
-            if DEBUG: print("Result: " + fs_single.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R9')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    c_single = command_id(command_on_ancestor)
+    fs_ids = FS_IDS_COMPARABLE
+    res_ids = seq_results(COMPARABLE, c1, c2)
+    rev_res_ids = seq_results(COMPARABLE, c2, c1)
+    not_same = (CANON[res_ids] != CANON[rev_res_ids])
+    if not not_same.any(): continue # the pair commutes everywhere; no need to check the single command
+    single_ids = cmd_results(COMPARABLE, c_single)
+    bad = not_same & (CANON[res_ids] == CANON[single_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+            print(f"Reverse: {sq_rev.info()}")
+            print(f"Result: {decode_fs(int(rev_res_ids[i])).info()}")
+            print(f"SingleCommand: {command_on_ancestor.info()}")
+            print(f"Result: {decode_fs(int(single_ids[i])).info()}")
+        fail('R9')
+        break
 else:
     ok('R9')
 
 
 begintest('R10', 'Rule 10')
 # Add assertion command on an ancestor node
-for sq in CommandPairFactory():
+for sq in COMMAND_PAIRS:
     if not sq.is_down(): continue # skip
     (command_on_ancestor, command_on_descendant) = sq.get_commands_on_ancestor_descendant()
     if command_on_descendant.is_empty_empty(): continue # skip
@@ -624,45 +904,50 @@ for sq in CommandPairFactory():
 
     sq_rev = sq.get_reverse()
 
-    for fs in chain(FilesystemFactory(DIRECT), FilesystemFactory(DISTANT)):
-        if DEBUG: print("---")
-        fs_res = fs.apply_commandpair(sq)
-        fs_rev_res = fs.apply_commandpair(sq_rev)
-        fs_single = fs.apply_command(command_on_descendant)
-        if not fs_res.is_same(fs_rev_res) and fs_res.is_same(fs_single):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Sequence: " + sq.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            if DEBUG: print("Reverse: " + sq_rev.info())
-            if DEBUG: print("Result: " + fs_rev_res.info())
-            if DEBUG: print("SingleCommand: " + singlecommand.info())
-            if DEBUG: print("Result: " + fs_single.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R10')
-    break
+    c1 = command_id(sq.first)
+    c2 = command_id(sq.last)
+    c_single = command_id(command_on_descendant)
+    fs_ids = FS_IDS_COMPARABLE
+    res_ids = seq_results(COMPARABLE, c1, c2)
+    rev_res_ids = seq_results(COMPARABLE, c2, c1)
+    not_same = (CANON[res_ids] != CANON[rev_res_ids])
+    if not not_same.any(): continue # the pair commutes everywhere; no need to check the single command
+    single_ids = cmd_results(COMPARABLE, c_single)
+    bad = not_same & (CANON[res_ids] == CANON[single_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Sequence: {sq.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+            print(f"Reverse: {sq_rev.info()}")
+            print(f"Result: {decode_fs(int(rev_res_ids[i])).info()}")
+            print(f"SingleCommand: {command_on_descendant.info()}")
+            print(f"Result: {decode_fs(int(single_ids[i])).info()}")
+        fail('R10')
+        break
 else:
     ok('R10')
 
 
 begintest('R11', 'Rule 11')
 # Assertion commands can be removed
-for command in CommandFactory(PATH1, 'New1'):
+for command in ALL_COMMANDS:
+    if command.path != PATH1: continue # skip
     if not command.is_assertion(): continue # skip
 
-    for fs in FilesystemFactory(SAME):
-        if DEBUG: print("---")
-        fs_res = fs.apply_command(command)
-        if not fs_res.is_extended_by(fs):
-            if DEBUG: print("Filesystem: " + fs.info())
-            if DEBUG: print("Command: " + command.info())
-            if DEBUG: print("Result: " + fs_res.info())
-            break # fail
-    else:
-        continue # trick to achieve break(2)
-    fail('R11')
-    break
+    c = command_id(command)
+    fs_ids = FS_IDS_BY_REL[SAME]
+    res_ids = cmd_results(SAME, c)
+    bad = (res_ids != BROKEN_FS) & (CANON[res_ids] != CANON[fs_ids])
+    if bad.any():
+        if DEBUG:
+            i = int(np.argmax(bad))
+            print(f"Filesystem: {decode_fs(int(fs_ids[i])).info()}")
+            print(f"Command: {command.info()}")
+            print(f"Result: {decode_fs(int(res_ids[i])).info()}")
+        fail('R11')
+        break
 else:
     ok('R11')
 